@@ -1,13 +1,24 @@
 import os
+import sys
 import json
 import uuid
+import heapq
+import tempfile
 import pandas as pd
 from glob import glob
+from itertools import groupby
 
 BASE_DIR = "./data/raw_data"
 QPOLLS_DIR = os.path.join(BASE_DIR, "qpoll")
 OUTPUT_FILE = "./data/cleaned_data/rdb_data.json"
 
+# 패널 병합 방식: "memory"(해시 인덱스) / "external"(정렬 run 기반 외부 병합)
+MERGE_MODE = os.getenv("MERGE_MODE", "memory")
+# external 모드에서 run 하나에 올릴 최대 메모리 (MB)
+MERGE_MEMORY_BUDGET_MB = float(os.getenv("MERGE_MEMORY_BUDGET_MB", "256"))
+# external 모드에서 한 번에 병합(동시 오픈)할 최대 run 파일 수
+MERGE_MAX_FAN_IN = int(os.getenv("MERGE_MAX_FAN_IN", "128"))
+
 
 # === UUID 생성 ===
 def generate_uuid():
@@ -47,8 +58,72 @@ def normalize_family_text(val):
 
 
 # === 병합 ===
-def merge_panel_data():
-    """welcome_1과 welcome_2를 panel_id 기준으로 병합하되, 매칭 안 되면 별도 패널로 구분"""
+def resolve_panel_id(r, tag):
+    """mb_sn 우선, 없으면 고유번호, 둘 다 없으면 익명(anon) id 부여"""
+    panel_id = clean_value(r.get("mb_sn"))
+    panel_id_2 = clean_value(r.get("고유번호"))
+    return panel_id or panel_id_2 or f"_anon_{tag}_{uuid.uuid4()}"
+
+
+def build_panel(pid, w1, w2, panel_uuid):
+    """welcome_1(기본정보) + welcome_2(추가정보) 레코드로 panel_master 행 생성"""
+
+    # --- 기본정보 (welcome_1) ---
+    base = {
+        "panel_uuid": panel_uuid,
+        "panel_id": pid if not pid.startswith("_anon_") else None,
+        "gender": clean_value(w1.get("gender") if w1 else None),
+        "birth_year": normalize_number(w1.get("birth_year") if w1 else None),
+        "region_main": clean_value(w1.get("region_main") if w1 else None),
+        "region_sub": clean_value(w1.get("region_sub") if w1 else None),
+    }
+
+    # --- 추가정보 (welcome_2) ---
+    extra = {
+        "marital_status": clean_value(w2.get("결혼여부") if w2 else None),
+        "child_num": normalize_number(w2.get("자녀수") if w2 else None, limit=10),
+        "family_num": normalize_family_text(w2.get("가족수") if w2 else None),
+        "education": clean_value(w2.get("최종학력") if w2 else None),
+        "job_category": clean_value(w2.get("직업") if w2 else None),
+        "job_detail": clean_value(w2.get("직무") if w2 else None),
+        "personal_income": clean_value(w2.get("월평균 개인소득") if w2 else None),
+        "household_income": clean_value(w2.get("월평균 가구소득") if w2 else None),
+        "owned_products": clean_value(w2.get("보유 전제품") if w2 else None),
+        "owned_phone_brand": clean_value(w2.get("보유 휴대폰 단말기 브랜드") if w2 else None),
+        "owned_phone_model": clean_value(w2.get("보유 휴대폰 모델명") if w2 else None),
+        "has_car": clean_value(w2.get("보유 차량 여부") if w2 else None),
+        "car_brand": clean_value(w2.get("자동차 제조사") if w2 else None),
+        "car_model": clean_value(w2.get("자동차 모델") if w2 else None),
+        "smoking_exp": clean_value(w2.get("흡연 경험") if w2 else None),
+        "smoking_brands": clean_value(w2.get("흡연경험 담배브랜드") if w2 else None),
+        "smoking_brands_other": clean_value(w2.get("흡연 경험 기타 담배 브랜드") if w2 else None),
+        "heated_tobacco_exp": normalize_number(w2.get("궐련형/가열식 전자담배 이용 경험") if w2 else None),
+        "heated_tobacco_other": clean_value(w2.get("전자담배 이용경험(기타내용)") if w2 else None),
+        "alcohol_exp": clean_value(w2.get("음용경험 술") if w2 else None),
+        "alcohol_exp_other": clean_value(w2.get("음용경험 술(기타내용)") if w2 else None),
+    }
+
+    return {**base, **extra}
+
+
+def merge_panel_data(mode=None, memory_budget_mb=None, max_fan_in=None):
+    """welcome_1과 welcome_2를 panel_id 기준으로 병합하되, 매칭 안 되면 별도 패널로 구분
+
+    mode="memory"   : 두 파일 전체를 해시 인덱스로 올려서 병합 (기본), 패널 리스트 반환
+    mode="external" : 정렬된 run 파일로 내려쓴 뒤 스트리밍 병합, 패널 generator 반환
+                      (memory_budget_mb / max_fan_in 적용, generator는 한 번만 순회 가능하며
+                       uuid_map은 generator를 끝까지 소비해야 모두 채워짐)
+    """
+    mode = mode or MERGE_MODE
+    if mode == "external":
+        # generator는 첫 순회 때 실행되므로 잘못된 설정은 여기서 바로 거름
+        check_external_params(memory_budget_mb, max_fan_in)
+        uuid_map = {}
+        return iter_panels_external(uuid_map, memory_budget_mb, max_fan_in), uuid_map
+    if mode != "memory":
+        raise ValueError(f"알 수 없는 병합 모드: {mode}")
+    if memory_budget_mb is not None or max_fan_in is not None:
+        raise ValueError("memory_budget_mb / max_fan_in은 external 모드에서만 사용할 수 있습니다")
 
     # 1️⃣ 파일 로드
     with open(os.path.join(BASE_DIR, "welcome_1.json"), "r", encoding="utf-8") as f1:
@@ -57,20 +132,14 @@ def merge_panel_data():
         welcome2 = json.load(f2)
 
     # 2️⃣ 인덱싱 (각 파일에서 panel_id 후보 생성)
+    # 두 컬럼 모두 있는 경우 mb_sn 우선 / 둘 다 없으면 anon
     w1_index = {}
     for r in welcome1:
-        panel_id = clean_value(r.get("mb_sn"))
-        panel_id_2 = clean_value(r.get("고유번호"))
-        # 두 컬럼 모두 있는 경우 mb_sn 우선 / 둘 다 없으면 anon
-        pid = panel_id or panel_id_2 or f"_anon_w1_{uuid.uuid4()}"
-        w1_index[pid] = r
+        w1_index[resolve_panel_id(r, "w1")] = r
 
     w2_index = {}
     for r in welcome2:
-        panel_id = clean_value(r.get("mb_sn"))
-        panel_id_2 = clean_value(r.get("고유번호"))
-        pid = panel_id or panel_id_2 or f"_anon_w2_{uuid.uuid4()}"
-        w2_index[pid] = r
+        w2_index[resolve_panel_id(r, "w2")] = r
 
     all_ids = set(w1_index.keys()) | set(w2_index.keys())
     uuid_map = {}
@@ -78,55 +147,177 @@ def merge_panel_data():
 
     # 3️⃣ 전체 ID 기준 병합
     for pid in all_ids:
-        w1 = w1_index.get(pid)
-        w2 = w2_index.get(pid)
-
         panel_uuid = generate_uuid()
         uuid_map[pid] = panel_uuid
-
-        # --- 기본정보 (welcome_1) ---
-        base = {
-            "panel_uuid": panel_uuid,
-            "panel_id": pid if not pid.startswith("_anon_") else None,
-            "gender": clean_value(w1.get("gender") if w1 else None),
-            "birth_year": normalize_number(w1.get("birth_year") if w1 else None),
-            "region_main": clean_value(w1.get("region_main") if w1 else None),
-            "region_sub": clean_value(w1.get("region_sub") if w1 else None),
-        }
-
-        # --- 추가정보 (welcome_2) ---
-        extra = {
-            "marital_status": clean_value(w2.get("결혼여부") if w2 else None),
-            "child_num": normalize_number(w2.get("자녀수") if w2 else None, limit=10),
-            "family_num": normalize_family_text(w2.get("가족수") if w2 else None),
-            "education": clean_value(w2.get("최종학력") if w2 else None),
-            "job_category": clean_value(w2.get("직업") if w2 else None),
-            "job_detail": clean_value(w2.get("직무") if w2 else None),
-            "personal_income": clean_value(w2.get("월평균 개인소득") if w2 else None),
-            "household_income": clean_value(w2.get("월평균 가구소득") if w2 else None),
-            "owned_products": clean_value(w2.get("보유 전제품") if w2 else None),
-            "owned_phone_brand": clean_value(w2.get("보유 휴대폰 단말기 브랜드") if w2 else None),
-            "owned_phone_model": clean_value(w2.get("보유 휴대폰 모델명") if w2 else None),
-            "has_car": clean_value(w2.get("보유 차량 여부") if w2 else None),
-            "car_brand": clean_value(w2.get("자동차 제조사") if w2 else None),
-            "car_model": clean_value(w2.get("자동차 모델") if w2 else None),
-            "smoking_exp": clean_value(w2.get("흡연 경험") if w2 else None),
-            "smoking_brands": clean_value(w2.get("흡연경험 담배브랜드") if w2 else None),
-            "smoking_brands_other": clean_value(w2.get("흡연 경험 기타 담배 브랜드") if w2 else None),
-            "heated_tobacco_exp": normalize_number(w2.get("궐련형/가열식 전자담배 이용 경험") if w2 else None),
-            "heated_tobacco_other": clean_value(w2.get("전자담배 이용경험(기타내용)") if w2 else None),
-            "alcohol_exp": clean_value(w2.get("음용경험 술") if w2 else None),
-            "alcohol_exp_other": clean_value(w2.get("음용경험 술(기타내용)") if w2 else None),
-        }
-
-        merged_panels.append({**base, **extra})
+        merged_panels.append(build_panel(pid, w1_index.get(pid), w2_index.get(pid), panel_uuid))
 
     return merged_panels, uuid_map
 
 
+# === 외부 정렬 병합 (out-of-core) ===
+def iter_json_array(path, chunk_size=1 << 20):
+    """JSON 배열 파일을 통째로 올리지 않고 원소 단위로 스트리밍"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        eof = False
+        started = False
+        pos = 0
+
+        while True:
+            # 공백 / 구분자 건너뛰기
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos < len(buf):
+                if not started:
+                    if buf[pos] != "[":
+                        raise ValueError(f"JSON 배열 형식이 아닙니다: {path}")
+                    started = True
+                    pos += 1
+                    continue
+
+                if buf[pos] == "]":
+                    return
+
+                try:
+                    obj, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    end = None
+
+                # 청크 경계에서 잘린 값('4.' 등)이 짧게 디코딩될 수 있으므로
+                # 값 뒤에 구분자가 실제로 보일 때만 확정
+                if end is not None and end < len(buf) and buf[end] in ",] \t\r\n":
+                    yield obj
+                    pos = end
+                    continue
+
+            if eof:
+                raise ValueError(f"JSON 파싱 실패: {path}")
+            chunk = f.read(chunk_size)
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+
+def buffered_size(pid, seq, line):
+    """run 버퍼 항목 (pid, seq, line) 하나가 실제로 차지하는 메모리 (리스트 슬롯 포함)"""
+    return (sys.getsizeof(line) + sys.getsizeof(pid) + sys.getsizeof(seq)
+            + sys.getsizeof((pid, seq, line)) + 8)
+
+
+def spill_sorted_runs(path, tag, source, run_dir, budget_bytes):
+    """레코드를 (panel_id, 출처, 순번) 기준으로 정렬된 run 파일들로 분할 저장"""
+    run_paths = []
+    buffer = []
+    buffer_bytes = 0
+
+    def flush():
+        # (pid, seq)가 유일하므로 line까지 비교되지 않음 → key 함수 없이 정렬
+        buffer.sort()
+        run_path = os.path.join(run_dir, f"{tag}_run_{len(run_paths):05d}.jsonl")
+        with open(run_path, "w", encoding="utf-8") as out:
+            for _, _, line in buffer:
+                out.write(line)
+        run_paths.append(run_path)
+        buffer.clear()
+
+    for seq, r in enumerate(iter_json_array(path)):
+        pid = resolve_panel_id(r, tag)
+        line = json.dumps([pid, source, seq, r], ensure_ascii=False) + "\n"
+        buffer.append((pid, seq, line))
+        buffer_bytes += buffered_size(pid, seq, line)
+        if buffer_bytes >= budget_bytes:
+            flush()
+            buffer_bytes = 0
+
+    if buffer:
+        flush()
+
+    return run_paths
+
+
+def run_sort_key(item):
+    pid, source, seq, _ = item
+    return pid, source, seq
+
+
+def iter_run(run_path):
+    with open(run_path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def reduce_runs(run_paths, run_dir, max_fan_in):
+    """run 개수가 max_fan_in 이하가 될 때까지 max_fan_in개씩 묶어 더 큰 run으로 병합"""
+    if max_fan_in < 2:
+        raise ValueError(f"max_fan_in은 2 이상이어야 합니다: {max_fan_in}")
+    level = 0
+    while len(run_paths) > max_fan_in:
+        merged_paths = []
+        for i in range(0, len(run_paths), max_fan_in):
+            group = run_paths[i:i + max_fan_in]
+            out_path = os.path.join(run_dir, f"pass{level}_run_{len(merged_paths):05d}.jsonl")
+            with open(out_path, "w", encoding="utf-8") as out:
+                for item in heapq.merge(*[iter_run(p) for p in group], key=run_sort_key):
+                    out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            for p in group:
+                os.remove(p)
+            merged_paths.append(out_path)
+        run_paths = merged_paths
+        level += 1
+    return run_paths
+
+
+def check_external_params(memory_budget_mb=None, max_fan_in=None):
+    """external 모드 설정 검증 후 (run 버퍼 바이트 수, fan-in) 반환 (None이면 기본값)"""
+    budget_mb = MERGE_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+    max_fan_in = MERGE_MAX_FAN_IN if max_fan_in is None else max_fan_in
+    if budget_mb <= 0:
+        raise ValueError(f"memory_budget_mb는 0보다 커야 합니다: {budget_mb}")
+    # fan-in 1 이하는 다단계 병합에서 run 수가 줄지 않아 끝나지 않음
+    if max_fan_in < 2:
+        raise ValueError(f"max_fan_in은 2 이상이어야 합니다: {max_fan_in}")
+    # 두 파일을 순차로 spill 하므로 예산 전체를 run 버퍼 하나에 사용
+    return int(budget_mb * 1024 * 1024), max_fan_in
+
+
+def iter_panels_external(uuid_map, memory_budget_mb=None, max_fan_in=None):
+    """welcome_1/welcome_2를 정렬 run으로 내려쓴 뒤 k-way 병합하며 패널을 하나씩 yield
+
+    run 버퍼는 memory_budget_mb, 동시에 여는 run 파일 수는 max_fan_in으로 제한됨.
+    uuid_map(panel_id → panel_uuid)은 설문 응답 매핑에 필요해서 패널 수만큼 커지는
+    유일한 구조로 남음.
+    """
+    budget_bytes, max_fan_in = check_external_params(memory_budget_mb, max_fan_in)
+
+    with tempfile.TemporaryDirectory(prefix="panel_merge_") as run_dir:
+        # 1️⃣ 정렬된 run 생성
+        run_paths = spill_sorted_runs(os.path.join(BASE_DIR, "welcome_1.json"), "w1", 1, run_dir, budget_bytes)
+        run_paths += spill_sorted_runs(os.path.join(BASE_DIR, "welcome_2.json"), "w2", 2, run_dir, budget_bytes)
+
+        # 2️⃣ 열린 파일 수 제한을 넘지 않도록 다단계 병합
+        run_paths = reduce_runs(run_paths, run_dir, max_fan_in)
+
+        # 3️⃣ panel_id 순으로 스트리밍 병합
+        merged = heapq.merge(*[iter_run(p) for p in run_paths], key=run_sort_key)
+
+        for pid, group in groupby(merged, key=lambda item: item[0]):
+            w1 = w2 = None
+            # 같은 파일 안에서 중복된 id는 in-memory 모드처럼 마지막 레코드가 남음
+            for _, source, _, r in group:
+                if source == 1:
+                    w1 = r
+                else:
+                    w2 = r
+
+            panel_uuid = generate_uuid()
+            uuid_map[pid] = panel_uuid
+            yield build_panel(pid, w1, w2, panel_uuid)
+
+
 # === 설문 응답 로드 ===
-def load_response_meta(uuid_map):
-    response_meta = []
+def iter_response_meta(uuid_map):
     qpoll_files = glob(os.path.join(QPOLLS_DIR, "qpoll_join_*.json"))
 
     for file_path in qpoll_files:
@@ -137,36 +328,51 @@ def load_response_meta(uuid_map):
         for row in data:
             pid = clean_value(row.get("고유번호") or row.get("mb_sn"))
             panel_uuid = uuid_map.get(pid)
-            response_meta.append({
+            yield {
                 "response_uuid": generate_uuid(),
                 "survey_id": survey_id,
                 "panel_uuid": panel_uuid,
                 "question_text": clean_value(row.get("질문")),
                 "answer_text": clean_value(row.get("답변")),
                 "answer_at": clean_value(row.get("설문일시"))
-            })
+            }
 
-    return response_meta
 
+def load_response_meta(uuid_map):
+    return list(iter_response_meta(uuid_map))
 
-# === 실행 ===
-def run():
-    print("📂 패널 데이터 병합 중...")
-    panel_master, uuid_map = merge_panel_data()
-    print(f"✅ 패널 {len(panel_master)}개 생성")
 
-    print("🧩 설문 응답 로드 중...")
-    response_meta = load_response_meta(uuid_map)
-    print(f"✅ 응답 {len(response_meta)}개 로드")
+# === 출력 ===
+def write_json_list(f, key, items, last=False):
+    """{"key": [...]} 항목을 json.dump(indent=2)와 같은 형식으로 한 건씩 기록, 기록 건수 반환"""
+    count = 0
+    f.write(f'  {json.dumps(key, ensure_ascii=False)}: [')
+    for item in items:
+        body = json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n    ")
+        f.write(("," if count else "") + "\n    " + body)
+        count += 1
+    f.write("\n  ]" if count else "]")
+    f.write("\n" if last else ",\n")
+    return count
 
-    final = {
-        "panel_master": panel_master,
-        "response_meta": response_meta
-    }
 
+# === 실행 ===
+def run():
     os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(final, f, ensure_ascii=False, indent=2)
+        f.write("{\n")
+
+        # 패널 / 응답을 한 건씩 파일로 흘려보내서 전체 결과를 메모리에 올리지 않음
+        print(f"📂 패널 데이터 병합 중... (mode={MERGE_MODE})")
+        panel_master, uuid_map = merge_panel_data()
+        panel_count = write_json_list(f, "panel_master", panel_master)
+        print(f"✅ 패널 {panel_count}개 생성")
+
+        print("🧩 설문 응답 로드 중...")
+        response_count = write_json_list(f, "response_meta", iter_response_meta(uuid_map), last=True)
+        print(f"✅ 응답 {response_count}개 로드")
+
+        f.write("}")
 
     print(f"🎉 완료! {OUTPUT_FILE}")
 
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import numpy as np
+from pathlib import Path
+
+# === 경로 / 설정 ===
+VECTOR_FILE = Path(os.getenv("VECTOR_FILE", "data/cleaned_data/embedded.jsonl"))
+# 코드북 / 코드 / 원본(리랭킹용)은 임베딩 파일 옆에 저장
+QUANT_METHOD = os.getenv("QUANT_METHOD", "pq")        # "int8" / "pq"
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "64"))   # PQ 서브공간 수 (차원의 약수여야 함)
+PQ_CENTROIDS = 256                                    # 서브공간당 centroid 수 (uint8 코드)
+PQ_TRAIN_SAMPLES = 20000
+PQ_ITERS = 20
+BLOCK_BYTES = 4 * 1024 * 1024                         # 블록 단위 계산 시 임시 배열 최대 크기
+# 리랭킹용 float32 원본 사본 저장 여부 (저장 공간이 원본만큼 추가로 듦)
+QUANT_KEEP_ORIGINALS = os.getenv("QUANT_KEEP_ORIGINALS", "0") == "1"
+
+
+def quant_paths(vector_file=VECTOR_FILE, method=QUANT_METHOD):
+    """임베딩 파일 옆에 둘 코드북 / 코드 / 원본 파일 경로"""
+    vector_file = Path(vector_file)
+    stem = vector_file.with_suffix("")
+    return {
+        "codebook": Path(f"{stem}.{method}.codebook.npz"),
+        "codes": Path(f"{stem}.{method}.codes.npy"),
+        # 원본 사본도 방식별로 분리해서 다른 방식의 build와 섞이지 않도록 함
+        "original": Path(f"{stem}.{method}.f32.npy"),
+    }
+
+
+def block_rows(row_bytes):
+    """행당 임시 메모리가 row_bytes일 때 BLOCK_BYTES 안에 들어가는 행 수"""
+    return max(1, BLOCK_BYTES // row_bytes)
+
+
+# === 임베딩 로드 ===
+def load_embeddings(vector_file=VECTOR_FILE):
+    """embedded.jsonl에서 (vector_uuid 목록, float32 행렬) 로드 (embedding 없는 행은 제외)"""
+    ids = []
+    vectors = []
+    with open(vector_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            rec = json.loads(line)
+            embedding = rec.get("embedding")
+            if not isinstance(embedding, list):
+                continue
+            ids.append(rec["vector_uuid"])
+            vectors.append(np.asarray(embedding, dtype=np.float32))
+
+    if not vectors:
+        raise ValueError(f"임베딩이 없습니다: {vector_file}")
+    return ids, np.vstack(vectors)
+
+
+# === Scalar int8 양자화 ===
+def train_int8(X):
+    """차원별 min/max로 0~255 구간에 선형 매핑하는 스칼라 양자화기 학습"""
+    lo = X.min(axis=0).astype(np.float32)
+    hi = X.max(axis=0).astype(np.float32)
+    scale = (hi - lo) / 255.0
+    scale[scale == 0] = 1.0
+    return {"method": "int8", "lo": lo, "scale": scale.astype(np.float32)}
+
+
+def encode_int8(codebook, X):
+    codes = np.rint((X - codebook["lo"]) / codebook["scale"])
+    return np.clip(codes, 0, 255).astype(np.uint8)
+
+
+def decode_int8(codebook, codes):
+    return codes.astype(np.float32) * codebook["scale"] + codebook["lo"]
+
+
+def int8_norms(codebook, codes):
+    """ADC용 사전계산: ||scale * c||^2 (벡터당 float32 1개)"""
+    norms = np.empty(len(codes), dtype=np.float32)
+    rows = block_rows(codes.shape[1] * 4)
+    for s in range(0, len(codes), rows):
+        block = codes[s:s + rows].astype(np.float32) * codebook["scale"]
+        norms[s:s + rows] = np.einsum("ij,ij->i", block, block)
+    return norms
+
+
+def adc_int8(codebook, codes, query, norms):
+    """비대칭 거리: 쿼리는 float 그대로, DB 쪽만 양자화된 값으로 L2^2 계산
+
+    x = lo + scale * c 이므로 ||q - x||^2 = ||q - lo||^2 - 2 c·((q - lo) * scale) + ||scale * c||^2
+    """
+    shifted = query - codebook["lo"]
+    weight = (shifted * codebook["scale"]).astype(np.float32)
+    const = float(shifted @ shifted)
+
+    dists = np.empty(len(codes), dtype=np.float32)
+    # float32로 캐스팅한 블록이 캐시 크기 수준에 머물도록 행 수를 바이트 기준으로 결정
+    rows = block_rows(codes.shape[1] * 4)
+    for s in range(0, len(codes), rows):
+        block = codes[s:s + rows].astype(np.float32)
+        dists[s:s + rows] = const - 2.0 * (block @ weight) + norms[s:s + rows]
+    return dists
+
+
+# === Product Quantization ===
+def kmeans(X, k, iters=PQ_ITERS, seed=0):
+    """numpy k-means (L2), 빈 클러스터는 임의 샘플로 재초기화"""
+    rng = np.random.default_rng(seed)
+    n = len(X)
+    centroids = X[rng.choice(n, size=k, replace=n < k)].copy()
+
+    for _ in range(iters):
+        # ||x - c||^2 = ||x||^2 - 2 x·c + ||c||^2 (||x||^2는 argmin에 무관)
+        d = -2.0 * (X @ centroids.T) + (centroids ** 2).sum(axis=1)
+        assign = d.argmin(axis=1)
+
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, X)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = X[rng.choice(n, size=int(empty.sum()))]
+
+    return centroids.astype(np.float32)
+
+
+def train_pq(X, m=PQ_SUBSPACES, k=PQ_CENTROIDS, n_train=PQ_TRAIN_SAMPLES, seed=0):
+    """차원을 m개 서브공간으로 나누고 서브공간마다 k개 centroid 학습"""
+    dim = X.shape[1]
+    if dim % m != 0:
+        raise ValueError(f"임베딩 차원({dim})이 PQ 서브공간 수({m})로 나누어 떨어지지 않습니다")
+
+    rng = np.random.default_rng(seed)
+    if len(X) > n_train:
+        X = X[rng.choice(len(X), size=n_train, replace=False)]
+
+    sub = dim // m
+    centroids = np.stack([
+        kmeans(X[:, j * sub:(j + 1) * sub], k, seed=seed + j)
+        for j in range(m)
+    ])
+    return {"method": "pq", "centroids": centroids}  # (m, k, sub)
+
+
+def encode_pq(codebook, X):
+    centroids = codebook["centroids"]
+    m, k, sub = centroids.shape
+    codes = np.empty((len(X), m), dtype=np.uint8)
+    c_norms = (centroids ** 2).sum(axis=2)
+
+    rows = block_rows(k * 4)
+    for s in range(0, len(X), rows):
+        block = X[s:s + rows]
+        for j in range(m):
+            part = block[:, j * sub:(j + 1) * sub]
+            d = -2.0 * (part @ centroids[j].T) + c_norms[j]
+            codes[s:s + rows, j] = d.argmin(axis=1)
+    return codes
+
+
+def decode_pq(codebook, codes):
+    centroids = codebook["centroids"]
+    m = centroids.shape[0]
+    return np.concatenate([centroids[j][codes[:, j]] for j in range(m)], axis=1)
+
+
+def adc_pq(codebook, codes, query):
+    """비대칭 거리: 쿼리-centroid 거리 테이블(m x k)을 만든 뒤 코드로 lookup 후 합산"""
+    centroids = codebook["centroids"]
+    m, k, sub = centroids.shape
+    table = ((query.reshape(m, 1, sub) - centroids) ** 2).sum(axis=2).astype(np.float32)
+    flat = table.ravel()
+    offsets = (np.arange(m) * k).astype(np.intp)
+
+    dists = np.empty(len(codes), dtype=np.float32)
+    # 행당 임시 메모리: intp 인덱스 m개 + lookup 결과 float32 m개
+    rows = block_rows(m * (np.dtype(np.intp).itemsize + 4))
+    for s in range(0, len(codes), rows):
+        idx = codes[s:s + rows].astype(np.intp) + offsets
+        dists[s:s + rows] = flat[idx].sum(axis=1)
+    return dists
+
+
+# === 공통 인터페이스 ===
+def train(X, method=QUANT_METHOD):
+    if method == "int8":
+        return train_int8(X)
+    if method == "pq":
+        return train_pq(X)
+    raise ValueError(f"알 수 없는 양자화 방식: {method}")
+
+
+def encode(codebook, X):
+    if codebook["method"] == "int8":
+        return encode_int8(codebook, X)
+    return encode_pq(codebook, X)
+
+
+def decode(codebook, codes):
+    if codebook["method"] == "int8":
+        return decode_int8(codebook, codes)
+    return decode_pq(codebook, codes)
+
+
+def save_codebook(path, codebook, ids):
+    """코드북 + vector_uuid 순서를 npz로 저장 (pickle 없이 로드 가능)"""
+    arrays = {k: v for k, v in codebook.items() if k != "method"}
+    np.savez(path, method=np.array(codebook["method"]), ids=np.array(ids), **arrays)
+
+
+def load_codebook(path):
+    with np.load(path) as data:
+        codebook = {k: data[k] for k in data.files if k not in ("method", "ids")}
+        codebook["method"] = str(data["method"])
+        ids = data["ids"].tolist()
+    return codebook, ids
+
+
+class QuantizedIndex:
+    """양자화된 코드로 ADC 검색, 필요하면 상위 후보를 원본 벡터로 exact 리랭킹"""
+
+    def __init__(self, codebook, codes, originals=None, ids=None):
+        self.codebook = codebook
+        self.codes = codes
+        self.originals = originals
+        self.ids = ids
+        self.norms = int8_norms(codebook, codes) if codebook["method"] == "int8" else None
+
+    @classmethod
+    def load(cls, vector_file=VECTOR_FILE, method=QUANT_METHOD, with_originals=True):
+        paths = quant_paths(vector_file, method)
+        codebook, ids = load_codebook(paths["codebook"])
+        codes = np.load(paths["codes"])
+        originals = None
+        if with_originals and paths["original"].exists():
+            # 리랭킹 후보만 읽도록 memmap으로 열기
+            originals = np.load(paths["original"], mmap_mode="r")
+            # 다른 build에서 남은 원본이면 행 순서가 codes / ids와 달라 리랭킹 결과가 틀어짐
+            if originals.shape[0] != len(codes):
+                raise ValueError(f"원본 사본이 코드와 맞지 않습니다 (다시 build 필요): {paths['original']}")
+        return cls(codebook, codes, originals, ids)
+
+    def approx_distances(self, query):
+        if self.codebook["method"] == "int8":
+            return adc_int8(self.codebook, self.codes, query, self.norms)
+        return adc_pq(self.codebook, self.codes, query)
+
+    def search_rows(self, query, top_k=10, rerank_k=0):
+        """(행 번호 배열, 거리 배열) 반환. rerank_k > top_k 이고 원본이 있으면 상위 rerank_k개를 exact 거리로 재정렬"""
+        query = np.asarray(query, dtype=np.float32)
+        if len(self.codes) == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        dists = self.approx_distances(query)
+
+        n_cand = max(top_k, rerank_k) if self.originals is not None else top_k
+        n_cand = min(n_cand, len(dists))
+        cand = np.argpartition(dists, n_cand - 1)[:n_cand]
+
+        if self.originals is not None and rerank_k > top_k:
+            cand = np.sort(cand)  # memmap 순차 접근
+            diff = np.asarray(self.originals[cand]) - query
+            exact = np.einsum("ij,ij->i", diff, diff)
+            order = np.argsort(exact)[:top_k]
+            return cand[order], exact[order]
+
+        order = np.argsort(dists[cand])[:top_k]
+        return cand[order], dists[cand][order]
+
+    def search(self, query, top_k=10, rerank_k=0):
+        """[(vector_uuid, 거리), ...]를 가까운 순으로 반환"""
+        rows, dists = self.search_rows(query, top_k=top_k, rerank_k=rerank_k)
+        return [(self.ids[i], float(d)) for i, d in zip(rows, dists)]
+
+
+# === 벤치마크 ===
+def exact_search(X, query, top_k):
+    dists = ((X - query) ** 2).sum(axis=1)
+    cand = np.argpartition(dists, top_k - 1)[:top_k]
+    return cand[np.argsort(dists[cand])]
+
+
+def benchmark(X, index, queries, top_k=10, rerank_k=0):
+    """원본 대비 메모리 절감률, 쿼리 지연시간, recall@k 측정
+
+    queries는 인덱스(X)에 포함되지 않은 벡터여야 함 (자기 자신이 거리 0으로 잡히면 recall이 부풀려짐)
+    """
+    truth = [exact_search(X, q, top_k) for q in queries]
+
+    start = time.perf_counter()
+    for q in queries:
+        exact_search(X, q, top_k)
+    exact_latency = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    results = [index.search_rows(q, top_k=top_k, rerank_k=rerank_k)[0] for q in queries]
+    quant_latency = (time.perf_counter() - start) / len(queries)
+
+    recall = np.mean([
+        len(set(r.tolist()) & set(t.tolist())) / top_k
+        for r, t in zip(results, truth)
+    ])
+
+    compressed_bytes = index.codes.nbytes
+    if index.norms is not None:
+        compressed_bytes += index.norms.nbytes
+    codebook_bytes = sum(v.nbytes for k, v in index.codebook.items() if k != "method")
+    # 리랭킹을 쓰면 float32 원본 사본이 추가로 필요
+    rerank_bytes = index.originals.nbytes if index.originals is not None and rerank_k > top_k else 0
+    total_bytes = compressed_bytes + codebook_bytes + rerank_bytes
+
+    return {
+        "method": index.codebook["method"],
+        "rerank_k": rerank_k,
+        "original_mb": X.nbytes / 1024 ** 2,
+        "compressed_mb": (compressed_bytes + codebook_bytes) / 1024 ** 2,
+        "rerank_mb": rerank_bytes / 1024 ** 2,
+        "reduction": X.nbytes / total_bytes,
+        "exact_ms": exact_latency * 1000,
+        "quant_ms": quant_latency * 1000,
+        f"recall@{top_k}": float(recall),
+    }
+
+
+def build(vector_file=VECTOR_FILE, method=QUANT_METHOD, keep_originals=QUANT_KEEP_ORIGINALS):
+    """embedded.jsonl → 코드북 학습, 코드 저장 (keep_originals면 리랭킹용 float32 원본도 저장)"""
+    ids, X = load_embeddings(vector_file)
+    print(f"📄 임베딩 {len(ids)}개 로드 (dim={X.shape[1]})")
+
+    start = time.time()
+    codebook = train(X, method)
+    codes = encode(codebook, X)
+    print(f"🧮 {method} 코드북 학습 + 인코딩 완료 ({time.time() - start:.1f}s)")
+
+    paths = quant_paths(vector_file, method)
+    save_codebook(paths["codebook"], codebook, ids)
+    np.save(paths["codes"], codes)
+    print(f"💾 저장 완료: {paths['codebook']} / {paths['codes']}")
+    if keep_originals:
+        np.save(paths["original"], X)
+        print(f"💾 리랭킹용 원본 저장: {paths['original']}")
+    elif paths["original"].exists():
+        # 이전 build의 원본이 남아 있으면 새 코드와 행 순서가 어긋나므로 삭제
+        paths["original"].unlink()
+        print(f"🗑 이전 원본 삭제: {paths['original']}")
+    return ids, X
+
+
+def holdout_benchmark(ids, X, method=QUANT_METHOD, n_queries=100, top_k=10, rerank_ks=(0, 100), seed=0):
+    """쿼리 n_queries개를 인덱스에서 빼고 나머지로 코드북 학습 / 인코딩 후 benchmark 실행"""
+    # 쿼리 최소 1개 + 인덱스에 top_k개 이상이 남아야 recall@k 계산 가능
+    n_queries = min(n_queries, len(X) - top_k)
+    if top_k <= 0 or n_queries <= 0:
+        raise ValueError(f"벤치마크할 벡터가 부족합니다 (벡터 {len(X)}개, top_k={top_k})")
+
+    rng = np.random.default_rng(seed)
+    query_mask = np.zeros(len(X), dtype=bool)
+    query_mask[rng.choice(len(X), size=n_queries, replace=False)] = True
+    queries, X_db = X[query_mask], X[~query_mask]
+    ids_db = [i for i, is_query in zip(ids, query_mask) if not is_query]
+
+    codebook = train(X_db, method)
+    index = QuantizedIndex(codebook, encode(codebook, X_db), originals=X_db, ids=ids_db)
+    return [benchmark(X_db, index, queries, top_k=top_k, rerank_k=rerank_k) for rerank_k in rerank_ks]
+
+
+if __name__ == "__main__":
+    print(f"🔹 임베딩 양자화 시작 (method={QUANT_METHOD})")
+    ids, X = build()
+
+    for report in holdout_benchmark(ids, X):
+        print(
+            f"📊 {report['method']} (rerank_k={report['rerank_k']}) | "
+            f"메모리: {report['original_mb']:.1f}MB → {report['compressed_mb']:.1f}MB "
+            f"+ 리랭킹 원본 {report['rerank_mb']:.1f}MB (x{report['reduction']:.1f}) | "
+            f"지연: exact {report['exact_ms']:.2f}ms / quant {report['quant_ms']:.2f}ms | "
+            f"recall@10: {report['recall@10']:.3f}"
+        )
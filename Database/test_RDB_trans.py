@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+import RDB_trans
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 64])
+def test_iter_json_array_matches_json_load(tmp_path, chunk_size):
+    data = [4.5e3, -0.25, 12, 1e-7, "문자열 \"따옴표\"", None, True, [], {"mb_sn": "w1", "가족수": "3명"}]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    assert list(RDB_trans.iter_json_array(path, chunk_size=chunk_size)) == json.loads(path.read_text(encoding="utf-8"))
+
+
+def test_iter_json_array_compact_numbers(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("[4.5e3]", encoding="utf-8")
+
+    for chunk_size in (1, 2, 3):
+        assert list(RDB_trans.iter_json_array(path, chunk_size=chunk_size)) == [4.5e3]
+
+
+def test_external_merge_matches_memory(tmp_path, monkeypatch):
+    welcome1 = [
+        {"mb_sn": "a", "gender": "남", "birth_year": "1990"},
+        {"고유번호": "b", "gender": "여"},
+        {"mb_sn": "a", "gender": "여", "birth_year": "1991"},  # 중복 id → 마지막 레코드
+        {"gender": "남"},                                      # anon
+    ]
+    welcome2 = [
+        {"mb_sn": "b", "결혼여부": "기혼", "자녀수": "2명"},
+        {"고유번호": "c", "가족수": "1명"},
+        {"직업": "학생"},                                      # anon
+    ]
+    (tmp_path / "welcome_1.json").write_text(json.dumps(welcome1, ensure_ascii=False), encoding="utf-8")
+    (tmp_path / "welcome_2.json").write_text(json.dumps(welcome2, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(RDB_trans, "BASE_DIR", str(tmp_path))
+
+    def normalize(panels):
+        return sorted(
+            json.dumps({k: v for k, v in p.items() if k != "panel_uuid"}, sort_keys=True, ensure_ascii=False)
+            for p in panels
+        )
+
+    memory_panels, memory_map = RDB_trans.merge_panel_data("memory")
+    # run 하나에 레코드 하나씩 + fan-in 2 → 다단계 병합까지 거치도록
+    external_uuid_map = {}
+    external_panels = list(RDB_trans.iter_panels_external(external_uuid_map, memory_budget_mb=1e-9, max_fan_in=2))
+
+    assert normalize(external_panels) == normalize(memory_panels)
+    assert len(external_uuid_map) == len(memory_map) == 5
+    assert {p["panel_uuid"] for p in external_panels} == set(external_uuid_map.values())
+
+
+def test_write_json_list_matches_json_dump(tmp_path):
+    panels = [{"panel_uuid": "u1", "panel_id": "a", "family_num": "1명(혼자거주)"}, {"panel_uuid": "u2", "panel_id": None}]
+    path = tmp_path / "out.json"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{\n")
+        RDB_trans.write_json_list(f, "panel_master", iter(panels))
+        RDB_trans.write_json_list(f, "response_meta", iter([]), last=True)
+        f.write("}")
+
+    expected = json.dumps({"panel_master": panels, "response_meta": []}, ensure_ascii=False, indent=2)
+    assert path.read_text(encoding="utf-8") == expected
+
+
+@pytest.mark.parametrize("max_fan_in", [1, 0, -3])
+def test_external_merge_rejects_small_fan_in(tmp_path, max_fan_in):
+    with pytest.raises(ValueError):
+        RDB_trans.merge_panel_data("external", max_fan_in=max_fan_in)
+    with pytest.raises(ValueError):
+        list(RDB_trans.iter_panels_external({}, max_fan_in=max_fan_in))
+    with pytest.raises(ValueError):
+        RDB_trans.reduce_runs([str(tmp_path / f"run_{i}") for i in range(3)], str(tmp_path), max_fan_in)
+
+
+def test_memory_merge_rejects_external_params():
+    with pytest.raises(ValueError):
+        RDB_trans.merge_panel_data("memory", memory_budget_mb=64)
+    with pytest.raises(ValueError):
+        RDB_trans.merge_panel_data("memory", max_fan_in=16)
@@ -0,0 +1,96 @@
+import json
+
+import numpy as np
+import pytest
+
+import Vector_Quant
+
+
+def make_vectors(n=300, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, dim)).astype(np.float32), rng.normal(size=dim).astype(np.float32)
+
+
+def write_embeddings(path, X):
+    with open(path, "w", encoding="utf-8") as f:
+        for i, v in enumerate(X):
+            f.write(json.dumps({"vector_uuid": f"v{i}", "embedding": v.tolist()}) + "\n")
+
+
+def test_adc_int8_matches_decoded_distance():
+    X, q = make_vectors()
+    codebook = Vector_Quant.train_int8(X)
+    codes = Vector_Quant.encode_int8(codebook, X)
+    norms = Vector_Quant.int8_norms(codebook, codes)
+
+    expected = ((Vector_Quant.decode(codebook, codes) - q) ** 2).sum(axis=1)
+    np.testing.assert_allclose(Vector_Quant.adc_int8(codebook, codes, q, norms), expected, rtol=1e-4, atol=1e-3)
+
+
+def test_adc_pq_matches_decoded_distance():
+    X, q = make_vectors()
+    codebook = Vector_Quant.train_pq(X, m=4, k=16)
+    codes = Vector_Quant.encode_pq(codebook, X)
+
+    expected = ((Vector_Quant.decode(codebook, codes) - q) ** 2).sum(axis=1)
+    np.testing.assert_allclose(Vector_Quant.adc_pq(codebook, codes, q), expected, rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize("method", ["int8", "pq"])
+def test_build_and_load_round_trip(tmp_path, method):
+    # 기본 PQ_SUBSPACES(64)로 나누어 떨어지는 차원
+    X, _ = make_vectors(n=280, dim=64)
+    vector_file = tmp_path / "embedded.jsonl"
+    write_embeddings(vector_file, X)
+
+    ids, _ = Vector_Quant.build(vector_file, method=method, keep_originals=True)
+    index = Vector_Quant.QuantizedIndex.load(vector_file, method=method)
+
+    assert index.codebook["method"] == method
+    assert index.ids == ids == [f"v{i}" for i in range(len(X))]
+    assert index.originals.shape == X.shape
+    assert index.search(X[5], top_k=1, rerank_k=10)[0][0] == "v5"
+
+    # 원본 없이 다시 build하면 이전 원본이 지워져서 리랭킹에 섞이지 않아야 함
+    Vector_Quant.build(vector_file, method=method, keep_originals=False)
+    assert not Vector_Quant.quant_paths(vector_file, method)["original"].exists()
+    assert Vector_Quant.QuantizedIndex.load(vector_file, method=method).originals is None
+
+
+def test_load_rejects_mismatched_originals(tmp_path):
+    X, _ = make_vectors(n=50)
+    vector_file = tmp_path / "embedded.jsonl"
+    write_embeddings(vector_file, X)
+    Vector_Quant.build(vector_file, method="int8", keep_originals=False)
+    np.save(Vector_Quant.quant_paths(vector_file, "int8")["original"], X[:40])
+
+    with pytest.raises(ValueError):
+        Vector_Quant.QuantizedIndex.load(vector_file, method="int8")
+
+
+def test_search_rows_rerank_returns_exact_distances():
+    X, q = make_vectors()
+    codebook = Vector_Quant.train_int8(X)
+    index = Vector_Quant.QuantizedIndex(codebook, Vector_Quant.encode_int8(codebook, X), originals=X)
+
+    rows, dists = index.search_rows(q, top_k=5, rerank_k=50)
+
+    np.testing.assert_allclose(dists, ((X[rows] - q) ** 2).sum(axis=1), rtol=1e-5)
+    assert np.all(np.diff(dists) >= 0)
+
+
+def test_search_rows_empty_inputs():
+    X, q = make_vectors()
+    codebook = Vector_Quant.train_int8(X)
+    empty = Vector_Quant.QuantizedIndex(codebook, np.empty((0, X.shape[1]), dtype=np.uint8))
+    full = Vector_Quant.QuantizedIndex(codebook, Vector_Quant.encode_int8(codebook, X))
+
+    assert len(empty.search_rows(q)[0]) == 0
+    assert len(full.search_rows(q, top_k=0)[0]) == 0
+
+
+def test_holdout_benchmark_rejects_too_few_vectors():
+    X, _ = make_vectors(n=8)
+
+    with pytest.raises(ValueError):
+        Vector_Quant.holdout_benchmark([f"v{i}" for i in range(len(X))], X, method="int8", top_k=10)